@@ -0,0 +1,134 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LoadShedder:
+    """Pick a voice transcription mode from queue wait time and process CPU usage."""
+
+    NORMAL = 0      # Configured model with the default VAD filter
+    DEGRADED = 1    # Smaller/faster fallback model
+    TRIMMED = 2     # Fallback model on aggressively VAD-trimmed audio
+    TEXT_ONLY = 3   # Voice is rejected, user is asked to type the reminder
+
+    LEVEL_NAMES = {
+        NORMAL: "normal",
+        DEGRADED: "degraded",
+        TRIMMED: "trimmed",
+        TEXT_ONLY: "text-only",
+    }
+
+    SAMPLE_INTERVAL = 5      # Seconds between CPU samples / level re-evaluations
+    WAIT_HALF_LIFE = 30      # Seconds for the queue wait average to halve with no new jobs
+
+    def __init__(self, wait_slo: float, cpu_high: float, cooldown: float,
+                 escalate_interval: float, skip_degraded: bool = False):
+        self.wait_slo = wait_slo
+        self.cpu_high = cpu_high
+        self.cooldown = cooldown
+        self.escalate_interval = escalate_interval
+        # DEGRADED is pointless when the fallback model is the primary model
+        if skip_degraded:
+            self.levels = [self.NORMAL, self.TRIMMED, self.TEXT_ONLY]
+        else:
+            self.levels = [self.NORMAL, self.DEGRADED, self.TRIMMED, self.TEXT_ONLY]
+        self.level = self.NORMAL
+        self.wait_avg = 0.0
+        self.cpu_usage = 0.0
+        self.pending = {}
+        self.last_change = time.monotonic()
+        self._last_decay = time.monotonic()
+        self._last_wall = time.monotonic()
+        self._last_cpu = time.process_time()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Sample load on a fixed period in a background thread."""
+        thread = threading.Thread(target=self._run, name="load-shedder")
+        thread.daemon = True
+        thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.SAMPLE_INTERVAL)
+            self.tick()
+
+    def tick(self) -> None:
+        """Take a CPU sample, decay the wait average and re-evaluate the level."""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._last_wall
+            if elapsed > 0:
+                now_cpu = time.process_time()
+                # Whole-process CPU against all cores, i.e. how saturated the machine is
+                cores = os.cpu_count() or 1
+                self.cpu_usage = (now_cpu - self._last_cpu) / (elapsed * cores)
+                self._last_wall = now
+                self._last_cpu = now_cpu
+            self._decay_wait(now)
+            self._evaluate(now)
+
+    def job_queued(self) -> object:
+        """Register a voice job waiting for transcription and return its token."""
+        token = object()
+        with self._lock:
+            self.pending[token] = time.monotonic()
+        return token
+
+    def job_started(self, token: object) -> None:
+        """Record how long a voice job waited before transcription started."""
+        with self._lock:
+            queued_at = self.pending.pop(token, None)
+            if queued_at is not None:
+                now = time.monotonic()
+                self._decay_wait(now)
+                # Exponentially weighted moving average smooths out single slow jobs
+                self.wait_avg = 0.7 * self.wait_avg + 0.3 * (now - queued_at)
+
+    def _decay_wait(self, now: float) -> None:
+        """Let the wait average fade with elapsed time while no jobs start."""
+        self.wait_avg *= 0.5 ** ((now - self._last_decay) / self.WAIT_HALF_LIFE)
+        self._last_decay = now
+
+    def job_finished(self, token: object) -> None:
+        """Forget a voice job that ended without reaching transcription."""
+        with self._lock:
+            self.pending.pop(token, None)
+
+    def current_level(self) -> int:
+        """Re-evaluate load and return the transcription level to use."""
+        with self._lock:
+            self._evaluate(time.monotonic())
+            return self.level
+
+    def _evaluate(self, now: float) -> None:
+        oldest_wait = now - min(self.pending.values()) if self.pending else 0.0
+        wait = max(self.wait_avg, oldest_wait)
+        # High CPU alone is just transcription doing its job; it only counts
+        # as overload while jobs are actually waiting for a worker.
+        overloaded = wait > self.wait_slo or (self.cpu_usage > self.cpu_high and bool(self.pending))
+        relaxed = (
+            wait < self.wait_slo / 2
+            and self.cpu_usage < self.cpu_high * 0.6
+            and not self.pending
+        )
+
+        # Escalate one step at a time so a single burst does not jump
+        # straight to text-only; recover more slowly to avoid flapping.
+        index = self.levels.index(self.level)
+        since_change = now - self.last_change
+        if overloaded and index < len(self.levels) - 1 and since_change >= self.escalate_interval:
+            self._set_level(self.levels[index + 1], wait, now)
+        elif relaxed and index > 0 and since_change >= self.cooldown:
+            self._set_level(self.levels[index - 1], wait, now)
+
+    def _set_level(self, level: int, wait: float, now: float) -> None:
+        logger.warning(
+            f"Voice load level {self.LEVEL_NAMES[self.level]} -> {self.LEVEL_NAMES[level]} "
+            f"(queue wait {wait:.1f}s, cpu {self.cpu_usage:.0%})"
+        )
+        self.level = level
+        self.last_change = now
@@ -20,8 +20,10 @@ import jdatetime  # For Persian calendar conversion
 from config import *  # Import all config settings
 from dotenv import load_dotenv
 from faster_whisper import WhisperModel
+from load_shedder import LoadShedder
 import asyncio
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables
 load_dotenv()
@@ -37,6 +39,9 @@ logger = logging.getLogger(__name__)
 # Persian timezone
 TEHRAN_TZ = pytz.timezone('Asia/Tehran')
 
+# Reply sent instead of transcribing when voice is shed under heavy load
+TEXT_ONLY_REPLY = "به دلیل بار زیاد، پیام صوتی موقتاً پردازش نمی‌شود. لطفاً یادآور خود را به صورت متنی بنویسید."
+
 class ReminderParser:
     def __init__(self):
         self.time_pattern = r'ساعت\s+(\d{1,2})(?::(\d{2}))?\s*(بعد از ظهر|صبح|عصر|شب)?'
@@ -116,15 +121,55 @@ class ReminderBot:
         self.compute_type = os.getenv('WHISPER_COMPUTE_TYPE', 'int8')
         self.cpu_threads = int(os.getenv('WHISPER_CPU_THREADS', '1'))
         self.max_concurrent = int(os.getenv('MAX_CONCURRENT_TRANSCRIPTIONS', '1'))
+        self.max_pending = int(os.getenv('MAX_PENDING_TRANSCRIPTIONS', str(self.max_concurrent * 4)))
         self.cleanup_interval = int(os.getenv('CLEANUP_INTERVAL', '300'))
+        # The fallback defaults to the primary model: there is no smaller
+        # model than the default 'tiny', so only trimming applies out of the box
+        self.fallback_model_size = os.getenv('WHISPER_FALLBACK_MODEL_SIZE', self.model_size)
+        self.fallback_compute_type = os.getenv('WHISPER_FALLBACK_COMPUTE_TYPE', self.compute_type)
+        
+        # Voice work runs on its own low-priority threads so the event loop
+        # (text messages, buttons) and the scheduler thread are never starved
+        self.voice_executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrent,
+            thread_name_prefix="voice",
+            initializer=self._lower_thread_priority
+        )
+        
+        # Load voice recognition models up front so degrading never adds load.
+        # Loading runs on a voice thread so the inference threads CTranslate2
+        # creates for each model inherit the lowered priority.
+        self.models = {}
+        self.models_lock = threading.Lock()
+        self.model = self.voice_executor.submit(
+            self._get_model, self.model_size, self.compute_type
+        ).result()
+        same_fallback = (
+            (self.fallback_model_size, self.fallback_compute_type)
+            == (self.model_size, self.compute_type)
+        )
+        if not same_fallback:
+            self.voice_executor.submit(
+                self._get_model, self.fallback_model_size, self.fallback_compute_type
+            ).result()
+        elif os.getenv('WHISPER_FALLBACK_MODEL_SIZE') or os.getenv('WHISPER_FALLBACK_COMPUTE_TYPE'):
+            logger.warning(
+                "Whisper fallback model matches the primary model; "
+                "load shedding will skip the degraded level"
+            )
+        else:
+            logger.info("No Whisper fallback model configured; load shedding will skip the degraded level")
         
-        # Initialize voice recognition model
-        self.model = WhisperModel(
-            self.model_size,
-            device="cpu",
-            compute_type=self.compute_type,
-            cpu_threads=self.cpu_threads
+        self.load_shedder = LoadShedder(
+            wait_slo=float(os.getenv('VOICE_QUEUE_WAIT_SLO', '5')),
+            cpu_high=float(os.getenv('VOICE_CPU_HIGH', '0.85')),
+            cooldown=float(os.getenv('LOAD_SHED_COOLDOWN', '60')),
+            escalate_interval=float(os.getenv('LOAD_SHED_ESCALATE_INTERVAL', '15')),
+            skip_degraded=same_fallback
         )
+        self.load_shedder.start()
+        # ffmpeg conversions are limited like transcriptions
+        self.ffmpeg_slots = asyncio.Semaphore(self.max_concurrent)
         
         # Create temp directory for voice files
         self.temp_dir = tempfile.mkdtemp()
@@ -205,16 +250,88 @@ class ReminderBot:
         )
         await update.message.reply_text(help_text)
 
+    def _get_model(self, model_size: str, compute_type: str) -> WhisperModel:
+        """Return a cached Whisper model, loading it on first use."""
+        key = (model_size, compute_type)
+        with self.models_lock:
+            if key not in self.models:
+                logger.info(f"Loading Whisper model {model_size} ({compute_type})")
+                self.models[key] = WhisperModel(
+                    model_size,
+                    device="cpu",
+                    compute_type=compute_type,
+                    cpu_threads=self.cpu_threads
+                )
+            return self.models[key]
+
+    @staticmethod
+    def _lower_thread_priority() -> None:
+        """Run voice worker threads at a lower priority than the rest of the bot."""
+        try:
+            # On Linux the nice value is per thread
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError) as e:
+            logger.warning(f"Could not lower voice thread priority: {e}")
+
+    async def _convert_to_wav(self, ogg_path: str, wav_path: str) -> None:
+        """Convert an OGG voice file to 16 kHz mono WAV with ffmpeg."""
+        async with self.ffmpeg_slots:
+            # Run ffmpeg at the same low priority as the voice worker threads
+            process = await asyncio.create_subprocess_exec(
+                "nice", "-n", "10", "ffmpeg", "-y", "-loglevel", "error",
+                "-i", ogg_path, "-ar", "16000", "-ac", "1", "-c:a", "pcm_s16le", wav_path,
+                stderr=asyncio.subprocess.PIPE
+            )
+            _, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(
+                f"ffmpeg exited with code {process.returncode}: {stderr.decode(errors='replace').strip()}"
+            )
+
+    def _transcribe(self, wav_path: str, job: object) -> Optional[str]:
+        """Transcribe a WAV file on a voice worker thread.
+
+        Returns None when voice has been shed to text-only while the job was queued.
+        """
+        self.load_shedder.job_started(job)
+        # Pick the level only now, so jobs stuck in the backlog are degraded too
+        level = self.load_shedder.current_level()
+        if level == LoadShedder.TEXT_ONLY:
+            return None
+        
+        if level == LoadShedder.NORMAL:
+            model = self.model
+        else:
+            model = self._get_model(self.fallback_model_size, self.fallback_compute_type)
+        
+        options = {"language": "fa", "beam_size": 1, "vad_filter": True}
+        if level >= LoadShedder.TRIMMED:
+            # Only decode tight speech regions and skip timestamp tokens
+            options.update(
+                vad_parameters={"min_silence_duration_ms": 300, "speech_pad_ms": 100},
+                without_timestamps=True,
+                condition_on_previous_text=False
+            )
+        
+        segments, info = model.transcribe(wav_path, **options)
+        return " ".join([segment.text for segment in segments])
+
     async def handle_voice(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Handle voice messages with memory management."""
-        if self.processing_count >= self.max_concurrent:
+        """Handle voice messages with memory management and load shedding."""
+        if self.load_shedder.current_level() == LoadShedder.TEXT_ONLY:
+            await update.message.reply_text(TEXT_ONLY_REPLY)
+            return
+
+        if self.processing_count >= self.max_pending:
             await update.message.reply_text(
                 "سیستم در حال حاضر مشغول است. لطفاً چند لحظه دیگر تلاش کنید."
             )
             return
 
+        self.processing_count += 1
+        job = None
+        ogg_path = wav_path = None
         try:
-            self.processing_count += 1
             voice = update.message.voice
             voice_file = await context.bot.get_file(voice.file_id)
             
@@ -225,25 +342,18 @@ class ReminderBot:
             # Download the voice file
             await voice_file.download_to_drive(ogg_path)
             
-            # Convert OGG to WAV using ffmpeg
-            os.system(f"ffmpeg -i {ogg_path} -ar 16000 -ac 1 -c:a pcm_s16le {wav_path}")
+            # Convert OGG to WAV using ffmpeg without blocking the event loop
+            await self._convert_to_wav(ogg_path, wav_path)
             
-            # Transcribe with optimized parameters
-            segments, info = self.model.transcribe(
-                wav_path,
-                language="fa",
-                beam_size=1,
-                vad_filter=True
+            # Transcribe on the voice executor with parameters for the current load level
+            job = self.load_shedder.job_queued()
+            loop = asyncio.get_running_loop()
+            text = await loop.run_in_executor(
+                self.voice_executor, self._transcribe, wav_path, job
             )
-            
-            text = " ".join([segment.text for segment in segments])
-            
-            # Clean up the files immediately after use
-            try:
-                os.remove(ogg_path)
-                os.remove(wav_path)
-            except Exception as e:
-                logger.error(f"Error cleaning up voice files: {e}")
+            if text is None:
+                await update.message.reply_text(TEXT_ONLY_REPLY)
+                return
             
             # Process the transcribed text
             await self._process_reminder_text(text, update, context)
@@ -258,6 +368,15 @@ class ReminderBot:
             )
         finally:
             self.processing_count -= 1
+            if job is not None:
+                self.load_shedder.job_finished(job)
+            # Clean up the files immediately after use
+            for path in (ogg_path, wav_path):
+                if path and os.path.exists(path):
+                    try:
+                        os.remove(path)
+                    except Exception as e:
+                        logger.error(f"Error cleaning up voice files: {e}")
             await self.cleanup_old_files()
 
     async def handle_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -654,6 +773,7 @@ class ReminderBot:
             self.application.run_polling()
         finally:
             # Cleanup on shutdown
+            self.voice_executor.shutdown(wait=False, cancel_futures=True)
             shutil.rmtree(self.temp_dir, ignore_errors=True)
 
 
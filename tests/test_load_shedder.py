@@ -0,0 +1,107 @@
+import unittest
+from unittest import mock
+
+from load_shedder import LoadShedder
+
+
+class FakeClock:
+    """Stand-in for time.monotonic / time.process_time driven by the test."""
+
+    def __init__(self):
+        self.wall = 1000.0
+        self.cpu = 0.0
+
+    def advance(self, seconds: float, busy_cores: float = 0.0) -> None:
+        self.wall += seconds
+        self.cpu += seconds * busy_cores
+
+
+class LoadShedderTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patches = [
+            mock.patch("load_shedder.time.monotonic", lambda: self.clock.wall),
+            mock.patch("load_shedder.time.process_time", lambda: self.clock.cpu),
+            mock.patch("load_shedder.os.cpu_count", return_value=4),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def make_shedder(self, **kwargs) -> LoadShedder:
+        options = {"wait_slo": 5, "cpu_high": 0.85, "cooldown": 60, "escalate_interval": 15}
+        options.update(kwargs)
+        return LoadShedder(**options)
+
+    def test_escalates_one_step_per_interval_on_oldest_pending_wait(self):
+        shedder = self.make_shedder()
+        shedder.job_queued()
+        self.clock.advance(16)
+        self.assertEqual(shedder.current_level(), LoadShedder.DEGRADED)
+        # Still overloaded, but the escalation interval has not passed yet
+        self.clock.advance(5)
+        self.assertEqual(shedder.current_level(), LoadShedder.DEGRADED)
+        self.clock.advance(10)
+        self.assertEqual(shedder.current_level(), LoadShedder.TRIMMED)
+        self.clock.advance(15)
+        self.assertEqual(shedder.current_level(), LoadShedder.TEXT_ONLY)
+
+    def test_skip_degraded_goes_straight_to_trimmed(self):
+        shedder = self.make_shedder(skip_degraded=True)
+        shedder.job_queued()
+        self.clock.advance(16)
+        self.assertEqual(shedder.current_level(), LoadShedder.TRIMMED)
+
+    def test_steps_down_after_cooldown_without_voice_traffic(self):
+        shedder = self.make_shedder()
+        job = shedder.job_queued()
+        self.clock.advance(16)
+        self.assertEqual(shedder.current_level(), LoadShedder.DEGRADED)
+        shedder.job_started(job)
+
+        # Recovery is driven by the periodic tick, not by incoming messages
+        for _ in range(11):
+            self.clock.advance(LoadShedder.SAMPLE_INTERVAL)
+            shedder.tick()
+        self.assertEqual(shedder.level, LoadShedder.DEGRADED)
+        self.clock.advance(LoadShedder.SAMPLE_INTERVAL)
+        shedder.tick()
+        self.assertEqual(shedder.level, LoadShedder.NORMAL)
+
+    def test_wait_average_decays_with_elapsed_time(self):
+        shedder = self.make_shedder()
+        job = shedder.job_queued()
+        self.clock.advance(10)
+        shedder.job_started(job)
+        self.assertAlmostEqual(shedder.wait_avg, 3.0)
+        self.clock.advance(LoadShedder.WAIT_HALF_LIFE)
+        shedder.tick()
+        self.assertAlmostEqual(shedder.wait_avg, 1.5)
+
+    def test_busy_worker_without_queue_is_not_overload(self):
+        shedder = self.make_shedder(cpu_high=0.2)
+        for _ in range(20):
+            self.clock.advance(LoadShedder.SAMPLE_INTERVAL, busy_cores=1)
+            shedder.tick()
+        self.assertEqual(shedder.level, LoadShedder.NORMAL)
+
+    def test_saturated_cpu_with_queued_jobs_escalates(self):
+        shedder = self.make_shedder()
+        shedder.job_queued()
+        self.clock.advance(LoadShedder.SAMPLE_INTERVAL, busy_cores=4)
+        shedder.tick()
+        self.assertEqual(shedder.level, LoadShedder.NORMAL)
+        self.clock.advance(LoadShedder.SAMPLE_INTERVAL * 2, busy_cores=4)
+        shedder.tick()
+        self.assertEqual(shedder.level, LoadShedder.DEGRADED)
+
+    def test_finished_job_no_longer_counts_as_pending(self):
+        shedder = self.make_shedder()
+        job = shedder.job_queued()
+        shedder.job_finished(job)
+        self.clock.advance(16)
+        self.assertEqual(shedder.current_level(), LoadShedder.NORMAL)
+
+
+if __name__ == "__main__":
+    unittest.main()